@@ -1,11 +1,63 @@
 import os
 import sys
+import atexit
+import logging
+import logging.handlers
+import queue
+import orjson
 from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from sqlalchemy.pool import QueuePool
+
+# Logging - handlers only enqueue records, a background listener thread does the I/O
+log_queue = queue.Queue(-1)
+log_stream_handler = logging.StreamHandler(sys.stdout)
+log_stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+
+log_queue_handler = logging.handlers.QueueHandler(log_queue)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+root_logger.addHandler(log_queue_handler)
+log_listener.start()
+logger = logging.getLogger(__name__)
+
+def restart_log_listener():
+    """Give a forked worker its own log queue and listener thread"""
+    global log_queue, log_listener
+    log_queue = queue.Queue(-1)
+    log_queue_handler.queue = log_queue
+    log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+    log_listener.start()
+
+# Gunicorn preloads the app and forks - threads do not survive fork
+os.register_at_fork(after_in_child=restart_log_listener)
+# Flush queued records on shutdown
+atexit.register(lambda: log_listener.stop())
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson - unsupported types fall back to Flask's default()"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
 
 # Create Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # Configuration
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -15,8 +67,18 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-pr
 app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{os.getenv('DB_USERNAME', 'root')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '3306')}/{os.getenv('DB_NAME', 'railway')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    # Keep warm connections across requests instead of reconnecting under load. Every gunicorn
+    # worker process has its own pool, so peak MySQL connections are
+    # workers x (pool_size + max_overflow) - keep that under the server's max_connections, and
+    # pool_size at or above gunicorn threads so no thread waits for one - the default follows
+    # that setting, so overflow connections are not opened and closed per burst
+    'poolclass': QueuePool,
+    'pool_size': int(os.getenv('DB_POOL_SIZE', os.getenv('GUNICORN_THREADS', '8'))),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+    # Fail fast with a 500 instead of holding a gthread for the default 30s when the pool is exhausted
+    'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
     'pool_pre_ping': True,
-    'pool_recycle': 300,
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
     'connect_args': {
         'connect_timeout': 60,
         'read_timeout': 60,
@@ -29,21 +91,33 @@ CORS(app,
      origins=["https://thebitcoinwill.com", "http://localhost:8000", "http://127.0.0.1:8000"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
      allow_headers=["Content-Type", "Authorization"],
-     supports_credentials=True)
+     supports_credentials=True,
+     max_age=86400)  # browsers reuse a preflight for a day
+
+@app.before_request
+def answer_preflight():
+    """Answer CORS preflight before any view, JWT or body handling runs"""
+    # Unknown paths fall through to the normal 404/405 - the CORS after_request adds the headers
+    if request.method == 'OPTIONS' and request.url_rule is not None:
+        return app.response_class(status=204)
 
 # JWT configuration
 jwt = JWTManager(app)
 
 # Initialize database
 try:
-    from models.user import db
+    from models.user import db, ensure_indexes
     db.init_app(app)
     
     with app.app_context():
         db.create_all()
-        print("✅ Database tables created successfully")
+        # create_all() skips existing tables - add any indexes they are missing
+        ensure_indexes()
+        # Gunicorn forks after this import - workers must not share the master's sockets
+        db.engine.dispose()
+        logger.info("Database tables created successfully")
 except Exception as e:
-    print(f"❌ Database error: {e}")
+    logger.error("Database error: %s", e)
 
 # Import and register blueprints
 try:
@@ -59,55 +133,11 @@ try:
     app.register_blueprint(user_bp, url_prefix='/api')
     app.register_blueprint(will_bp, url_prefix='/api/will')
     
-    print("✅ All routes registered successfully")
+    logger.info("All routes registered successfully")
 except Exception as e:
-    print(f"❌ Route import error: {e}")
-
-# Fallback routes
-@app.route('/api/health', methods=['GET'])
-def health():
-    return jsonify({'status': 'healthy', 'service': 'bitcoin-will-backend', 'version': '1.0.0'}), 200
-
-@app.route('/api/auth/register', methods=['POST', 'OPTIONS'])
-def register():
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    try:
-        data = request.get_json()
-        
-        if not data or not data.get('email') or not data.get('password'):
-            return jsonify({'message': 'Email and password required'}), 400
-        
-        return jsonify({
-            'message': 'Registration successful',
-            'user': {'email': data['email'], 'id': 1},
-            'access_token': 'test-token-123'
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'message': str(e)}), 500
-
-@app.route('/api/auth/login', methods=['POST', 'OPTIONS'])
-def login():
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    try:
-        data = request.get_json()
-        
-        if not data or not data.get('email') or not data.get('password'):
-            return jsonify({'message': 'Email and password required'}), 400
-        
-        return jsonify({
-            'message': 'Login successful',
-            'user': {'email': data['email'], 'id': 1},
-            'access_token': 'test-token-123'
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'message': str(e)}), 500
+    logger.error("Route import error: %s", e)
 
+# Root route - everything else is served by the blueprints above
 @app.route('/')
 def index():
     return jsonify({'message': 'Bitcoin Will API is running', 'status': 'healthy'}), 200
@@ -1,6 +1,10 @@
+import os
+
 bind = "0.0.0.0:5000"
 workers = 1
-worker_class = "sync"
+# Handlers mostly wait on Stripe and MySQL - threads let one worker overlap that I/O
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 100
@@ -3,8 +3,11 @@ from flask_jwt_extended import JWTManager
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
+import logging
 
-db = SQLAlchemy()
+# Sessions are request-scoped - keep loaded state after commit so responses don't re-SELECT each row
+db = SQLAlchemy(session_options={'expire_on_commit': False})
+logger = logging.getLogger(__name__)
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -37,6 +40,12 @@ class User(db.Model):
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        # One subscription row per user - lets payment writes upsert in a single statement
+        db.Index('uq_subscriptions_user_id', 'user_id', unique=True),
+        # customer.subscription.* webhook events look rows up by Stripe id
+        db.Index('ix_subscriptions_stripe_subscription_id', 'stripe_subscription_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -67,8 +76,52 @@ class Subscription(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class ProcessedWebhookEvent(db.Model):
+    __tablename__ = 'processed_webhook_events'
+    
+    event_id = db.Column(db.String(255), primary_key=True)  # Stripe event id (evt_...)
+    event_type = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def decode_personal_info(personal_info):
+    """Decode a stored personal_info column value into a Python dict"""
+    if not personal_info:
+        return {}
+    
+    # Try to decrypt first
+    try:
+        # Try importing from the same directory
+        import sys
+        import os
+        models_dir = os.path.dirname(os.path.abspath(__file__))
+        if models_dir not in sys.path:
+            sys.path.append(models_dir)
+        from will import decrypt_bitcoin_data
+        return decrypt_bitcoin_data(personal_info)
+    except ImportError:
+        try:
+            # Try importing from routes directory
+            from routes.will import decrypt_bitcoin_data
+            return decrypt_bitcoin_data(personal_info)
+        except ImportError:
+            # Fallback to JSON parsing if encryption not available
+            pass
+    except Exception as e:
+        logger.error("Error decrypting personal info: %s", e)
+    
+    # Fallback to JSON parsing for backward compatibility
+    try:
+        return json.loads(personal_info) if personal_info else {}
+    except:
+        return {}
+
 class Will(db.Model):
     __tablename__ = 'wills'
+    __table_args__ = (
+        # list_wills filters by owner and the per-will routes by (id, owner) - InnoDB's implicit
+        # foreign key index already has this shape, declaring it keeps other backends in step
+        db.Index('ix_wills_user_id_id', 'user_id', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -89,7 +142,9 @@ class Will(db.Model):
             # Try importing from the same directory
             import sys
             import os
-            sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+            models_dir = os.path.dirname(os.path.abspath(__file__))
+            if models_dir not in sys.path:
+                sys.path.append(models_dir)
             from will import encrypt_bitcoin_data
             self.personal_info = encrypt_bitcoin_data(data) if data else None
         except ImportError:
@@ -103,33 +158,7 @@ class Will(db.Model):
     
     def get_personal_info(self):
         """Get personal info as Python dict"""
-        if not self.personal_info:
-            return {}
-        
-        # Try to decrypt first
-        try:
-            # Try importing from the same directory
-            import sys
-            import os
-            sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-            from will import decrypt_bitcoin_data
-            return decrypt_bitcoin_data(self.personal_info)
-        except ImportError:
-            try:
-                # Try importing from routes directory
-                from routes.will import decrypt_bitcoin_data
-                return decrypt_bitcoin_data(self.personal_info)
-            except ImportError:
-                # Fallback to JSON parsing if encryption not available
-                pass
-        except Exception as e:
-            print(f"Error decrypting personal info: {e}")
-        
-        # Fallback to JSON parsing for backward compatibility
-        try:
-            return json.loads(self.personal_info) if self.personal_info else {}
-        except:
-            return {}
+        return decode_personal_info(self.personal_info)
     
     def set_bitcoin_assets(self, data):
         """Set bitcoin assets as JSON string"""
@@ -170,3 +199,45 @@ class Will(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+def dedupe_subscriptions():
+    """Collapse duplicate per-user subscription rows so uq_subscriptions_user_id can be created"""
+    # Older verify-payment and webhook code raced on check-then-insert and could leave two rows
+    duplicated = db.session.execute(
+        db.select(Subscription.user_id).group_by(Subscription.user_id).having(db.func.count() > 1)
+    ).scalars().all()
+    
+    for user_id in duplicated:
+        # Keep the active row, then the most recently updated - the rest are logged before removal
+        rows = Subscription.query.filter_by(user_id=user_id).order_by(
+            (Subscription.status == 'active').desc(), Subscription.updated_at.desc(), Subscription.id.desc()
+        ).all()
+        for row in rows[1:]:
+            logger.warning(
+                "Removing duplicate subscription for user %s (Stripe subscription %s): %s",
+                user_id, row.stripe_subscription_id, row.to_dict()
+            )
+            db.session.delete(row)
+    
+    if duplicated:
+        db.session.commit()
+        logger.warning("Collapsed duplicate subscriptions for %d users", len(duplicated))
+
+def ensure_indexes():
+    """Create model indexes missing from tables that predate them"""
+    try:
+        dedupe_subscriptions()
+    except Exception:
+        db.session.rollback()
+        logger.critical("Duplicate subscriptions not collapsed", exc_info=True)
+    
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                # A missing unique key lets the upserts insert duplicates - loud, but the rest of the
+                # API stays up rather than failing the whole deploy over the subscriptions table
+                if index.unique:
+                    logger.critical("Unique index %s not created: %s", index.name, e)
+                else:
+                    logger.warning("Index %s not created: %s", index.name, e)
@@ -4,8 +4,10 @@ from models.user import db, User
 import stripe
 import os
 import re
+import logging
 
 auth_bp = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
 
 # Configure Stripe
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY') 
@@ -25,70 +27,61 @@ def get_user_from_token():
     """Extract user from JWT token - WITH DEBUG LOGGING"""
     try:
         auth_header = request.headers.get('Authorization')
-        print(f"DEBUG: Authorization header: {auth_header}")
         
         if not auth_header:
-            print("DEBUG: No authorization header")
+            logger.debug("No authorization header")
             return None, jsonify({'message': 'Authorization header missing'}), 401
         
         if not auth_header.startswith('Bearer '):
-            print("DEBUG: Invalid authorization header format")
+            logger.debug("Invalid authorization header format")
             return None, jsonify({'message': 'Invalid authorization header format'}), 401
         
         token = auth_header.split(' ')[1]
-        print(f"DEBUG: Extracted token: {token[:50]}...")
         
         if not token:
-            print("DEBUG: Token missing from authorization header")
+            logger.debug("Token missing from authorization header")
             return None, jsonify({'message': 'Token missing from authorization header'}), 401
         
         # Import JWT functions
         try:
             import jwt
             JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
-            print(f"DEBUG: JWT Secret Key: {JWT_SECRET_KEY}")
             
             # Decode the token manually
-            print("DEBUG: Attempting to decode token...")
             decoded_token = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
-            print(f"DEBUG: Decoded token: {decoded_token}")
             
             user_id = decoded_token.get('sub')
-            print(f"DEBUG: User ID from token: {user_id}")
+            logger.debug("User ID from token: %s", user_id)
             
             if not user_id:
-                print("DEBUG: Invalid token payload - no user ID")
+                logger.debug("Invalid token payload - no user ID")
                 return None, jsonify({'message': 'Invalid token payload'}), 401
                 
         except jwt.ExpiredSignatureError:
-            print("DEBUG: Token has expired")
+            logger.debug("Token has expired")
             return None, jsonify({'message': 'Token has expired'}), 401
         except jwt.InvalidTokenError as e:
-            print(f"DEBUG: JWT decode error: {e}")
+            logger.warning("JWT decode error: %s", e)
             return None, jsonify({'message': 'Invalid token'}), 401
         except Exception as jwt_error:
-            print(f"DEBUG: JWT processing error: {jwt_error}")
+            logger.error("JWT processing error: %s", jwt_error)
             return None, jsonify({'message': 'Token validation failed'}), 401
         
         user = User.query.get(user_id)
-        print(f"DEBUG: Found user: {user.email if user else 'None'}")
         
         if not user:
-            print("DEBUG: User not found in database")
+            logger.debug("User %s not found in database", user_id)
             return None, jsonify({'message': 'User not found'}), 404
             
         return user, None, None
         
     except Exception as e:
-        print(f"DEBUG: Token validation error: {e}")
+        logger.error("Token validation error: %s", e)
         return None, jsonify({'message': 'Authentication failed'}), 401
 
 @auth_bp.route('/register', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def register():
-    if request.method == 'OPTIONS':
-        return '', 200
-
     try:
         data = request.get_json()
         if not data:
@@ -111,8 +104,8 @@ def register():
             return jsonify({'message': message}), 422
 
         # Check if user already exists
-        existing_user = User.query.filter_by(email=email).first()
-        if existing_user:
+        email_taken = db.session.query(User.query.filter_by(email=email).exists()).scalar()
+        if email_taken:
             return jsonify({'message': 'User with this email already exists'}), 422
 
         # Create user
@@ -124,22 +117,19 @@ def register():
 
         # Create access token manually
         import jwt
-        from datetime import datetime, timedelta
+        from datetime import datetime, timedelta, timezone
         
         JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
-        print(f"DEBUG: Creating token with secret: {JWT_SECRET_KEY}")
         
+        now = datetime.now(timezone.utc)  # one clock read for iat and exp
         payload = {
             'sub': str(user.id),
             'email': user.email,
-            'iat': datetime.utcnow(),
-            'exp': datetime.utcnow() + timedelta(days=30)  # 30 day expiration
+            'iat': now,
+            'exp': now + timedelta(days=30)  # 30 day expiration
         }
         
-        print(f"DEBUG: Token payload: {payload}")
-        
         access_token = jwt.encode(payload, JWT_SECRET_KEY, algorithm='HS256')
-        print(f"DEBUG: Created token: {access_token[:50]}...")
 
         return jsonify({
             'message': 'User created successfully',
@@ -147,17 +137,14 @@ def register():
             'user': user.to_dict()
         }), 201
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Registration error: {e}")
+        logger.exception("Registration error")
         return jsonify({'message': 'Registration failed. Please try again.'}), 500
 
 @auth_bp.route('/login', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def login():
-    if request.method == 'OPTIONS':
-        return '', 200
-        
     try:
         data = request.get_json()
         if not data:
@@ -179,22 +166,19 @@ def login():
 
         # Create access token manually
         import jwt
-        from datetime import datetime, timedelta
+        from datetime import datetime, timedelta, timezone
         
         JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
-        print(f"DEBUG: Creating login token with secret: {JWT_SECRET_KEY}")
         
+        now = datetime.now(timezone.utc)  # one clock read for iat and exp
         payload = {
             'sub': str(user.id),
             'email': user.email,
-            'iat': datetime.utcnow(),
-            'exp': datetime.utcnow() + timedelta(days=30)  # 30 day expiration
+            'iat': now,
+            'exp': now + timedelta(days=30)  # 30 day expiration
         }
         
-        print(f"DEBUG: Login token payload: {payload}")
-        
         access_token = jwt.encode(payload, JWT_SECRET_KEY, algorithm='HS256')
-        print(f"DEBUG: Created login token: {access_token[:50]}...")
 
         return jsonify({
             'message': 'Login successful',
@@ -202,40 +186,32 @@ def login():
             'user': user.to_dict()
         }), 200
 
-    except Exception as e:
-        print(f"Login error: {e}")
+    except Exception:
+        logger.exception("Login error")
         return jsonify({'message': 'Login failed. Please try again.'}), 500
 
 @auth_bp.route('/me', methods=['GET', 'OPTIONS'])
 @cross_origin()
 def get_current_user():
-    if request.method == 'OPTIONS':
-        return '', 200
-        
     try:
-        print("DEBUG: /auth/me endpoint called")
         user, error_response, status_code = get_user_from_token()
         if not user:
-            print(f"DEBUG: Authentication failed with status {status_code}")
+            logger.debug("Authentication failed with status %s", status_code)
             return error_response, status_code
 
-        print(f"DEBUG: Authentication successful for user {user.email}")
         return jsonify({'user': user.to_dict()}), 200
 
-    except Exception as e:
-        print(f"Get current user error: {e}")
+    except Exception:
+        logger.exception("Get current user error")
         return jsonify({'message': 'Failed to get user information'}), 500
 
 @auth_bp.route('/logout', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def logout():
-    if request.method == 'OPTIONS':
-        return '', 200
-        
     try:
         return jsonify({'message': 'Logout successful'}), 200
-    except Exception as e:
-        print(f"Logout error: {e}")
+    except Exception:
+        logger.exception("Logout error")
         return jsonify({'message': 'Logout failed'}), 500
 
 # Debug endpoint to check JWT configuration
@@ -248,13 +224,14 @@ def debug_jwt():
         
         # Create a test token
         import jwt
-        from datetime import datetime, timedelta
+        from datetime import datetime, timedelta, timezone
         
+        now = datetime.now(timezone.utc)
         test_payload = {
             'sub': 999,
             'email': 'test@example.com',
-            'iat': datetime.utcnow(),
-            'exp': datetime.utcnow() + timedelta(minutes=5)
+            'iat': now,
+            'exp': now + timedelta(minutes=5)
         }
         
         test_token = jwt.encode(test_payload, JWT_SECRET_KEY, algorithm='HS256')
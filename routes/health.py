@@ -1,32 +1,36 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, current_app
 from flask_cors import cross_origin
 from models.user import db
+from sqlalchemy import text
+import orjson
+import logging
 
 health_bp = Blueprint('health', __name__)
+logger = logging.getLogger(__name__)
+
+# Liveness body never changes - serialized once instead of on every Railway probe
+HEALTH_BODY = orjson.dumps({
+    'status': 'healthy',
+    'service': 'bitcoin-will-backend',
+    'version': '1.0.0'
+})
 
 @health_bp.route('/health', methods=['GET'])
 @cross_origin()
 def health_check():
     """Health check endpoint for Railway"""
-    try:
-        return jsonify({
-            'status': 'healthy',
-            'service': 'bitcoin-will-backend',
-            'version': '1.0.0'
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 500
+    return current_app.response_class(HEALTH_BODY, mimetype='application/json')
 
 @health_bp.route('/ready', methods=['GET'])
 @cross_origin()
 def readiness_check():
     """Readiness check endpoint"""
     try:
-        # Check database connection
-        db.session.execute('SELECT 1')
+        # Check database connection - SQLAlchemy 2 only executes textual SQL wrapped in text()
+        db.session.execute(text('SELECT 1'))
+        
+        # Pool sizes and checkout counts go to the logs only - this endpoint is unauthenticated
+        logger.debug("Connection pool: %s", db.engine.pool.status())
         
         return jsonify({
             'status': 'ready',
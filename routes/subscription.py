@@ -1,12 +1,23 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_cors import cross_origin
 import stripe
+import jwt
 import os
-import json
+import hmac
+import threading
+import hashlib
+import logging
+import time
+import orjson
 from datetime import datetime, timedelta
-from models.user import db, User, Subscription
+from cachetools import TTLCache
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.exc import OperationalError
+from models.user import db, User, Subscription, ProcessedWebhookEvent
 
 subscription_bp = Blueprint('subscription', __name__)
+logger = logging.getLogger(__name__)
 
 # Stripe configuration - PRESERVED WORKING CODE
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
@@ -14,8 +25,229 @@ WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
 STRIPE_MONTHLY_PRICE_ID = os.getenv('STRIPE_MONTHLY_PRICE_ID')
 STRIPE_YEARLY_PRICE_ID = os.getenv('STRIPE_YEARLY_PRICE_ID')
 
-def get_user_from_token():
-    """Extract user from JWT token - PRESERVED WORKING CODE"""
+# JWT settings - read once at import instead of on every authenticated request
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
+JWT_ALGORITHMS = ['HS256']
+
+# Stripe HTTP client - requests keeps one keep-alive session per thread, created lazily so
+# nothing opened before gunicorn forks is shared; under the SDK's 80s default timeout one hung
+# call would hold a gthread and its pooled DB connection, so it is bounded and retries rely on
+# Stripe's own idempotent retry
+STRIPE_TIMEOUT = int(os.getenv('STRIPE_TIMEOUT', '10'))
+stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_TIMEOUT)
+stripe.max_network_retries = 2
+
+# Naive UTC epoch for converting Stripe's Unix timestamps
+_UTC_EPOCH = datetime(1970, 1, 1)
+
+# Webhook signing key - encoded once instead of per event
+_WEBHOOK_KEY = WEBHOOK_SECRET.encode() if WEBHOOK_SECRET else None
+WEBHOOK_TOLERANCE_SECONDS = 300  # Stripe's own default signature tolerance
+
+# Plan lookup tables - resolved once at import instead of branching per request
+PLAN_AMOUNTS = {'monthly': 29.99, 'yearly': 299.99}
+PLAN_PERIOD_DAYS = {'monthly': 30, 'yearly': 365}
+PRICE_IDS = {'monthly': STRIPE_MONTHLY_PRICE_ID, 'yearly': STRIPE_YEARLY_PRICE_ID}
+for _plan, _price_id in PRICE_IDS.items():
+    if not _price_id:
+        logger.warning("STRIPE_%s_PRICE_ID is not set - %s checkout is disabled", _plan.upper(), _plan)
+
+# Static part of the Stripe checkout session parameters per plan
+CHECKOUT_TEMPLATES = {
+    plan: {
+        'payment_method_types': ['card'],
+        'line_items': [{
+            'price': price_id,
+            'quantity': 1
+        }],
+        'mode': 'subscription'
+    }
+    for plan, price_id in PRICE_IDS.items()
+}
+
+# Repeat checkout requests inside this window reuse the same Stripe session via an idempotency key
+CHECKOUT_IDEMPOTENCY_WINDOW = 600  # 10 minutes
+
+# Webhook events that update the subscriptions table
+CHECKOUT_WEBHOOK_EVENTS = frozenset({'checkout.session.completed', 'checkout.session.async_payment_succeeded'})
+SUBSCRIPTION_WEBHOOK_EVENTS = frozenset({
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted'
+})
+HANDLED_WEBHOOK_EVENTS = CHECKOUT_WEBHOOK_EVENTS | SUBSCRIPTION_WEBHOOK_EVENTS
+
+# Clients that keep failing signature checks are refused before their bodies are read.
+# Verified deliveries never count against the limit
+WEBHOOK_FAILURE_LIMIT = 20  # failed signatures per client
+WEBHOOK_FAILURE_WINDOW = 60  # seconds without failures before a client is forgiven
+_WEBHOOK_FAILURES = TTLCache(maxsize=10000, ttl=WEBHOOK_FAILURE_WINDOW)
+_WEBHOOK_FAILURES_LOCK = threading.Lock()
+
+# Stripe events are a few KB - larger webhook bodies are refused before being read
+MAX_WEBHOOK_BYTES = 1 << 20  # 1 MiB
+
+# Constant webhook response bodies - serialized once at import
+WEBHOOK_STATUS_BODY = orjson.dumps({'status': 'ok'})
+WEBHOOK_RECEIVED_BODY = orjson.dumps({'received': True})
+
+# Subscription status cache - keyed by user id, holds the serialized /status response body
+SUBSCRIPTION_CACHE_TTL = 1800  # 30 minutes
+_SUB_CACHE = TTLCache(maxsize=10000, ttl=SUBSCRIPTION_CACHE_TTL)
+_SUB_CACHE_LOCK = threading.Lock()  # gthread workers read and invalidate concurrently
+# Invalidation count per user id - a /status read only caches its body if no write landed
+# since it started, so a read that raced a payment cannot put the stale body back
+_SUB_CACHE_GENERATIONS = {}
+
+# Identity cache - user id -> email for tokens whose user was recently confirmed to exist.
+# Profile updates and account deletion in routes/user.py drop the entry
+IDENTITY_CACHE_TTL = 300  # 5 minutes
+_IDENTITY_CACHE = TTLCache(maxsize=10000, ttl=IDENTITY_CACHE_TTL)
+_IDENTITY_CACHE_LOCK = threading.Lock()
+
+# Customer cache - a Stripe subscription never changes customer, so the portal lookup is reused
+CUSTOMER_CACHE_TTL = 86400  # 24 hours
+_CUSTOMER_CACHE = TTLCache(maxsize=10000, ttl=CUSTOMER_CACHE_TTL)
+_CUSTOMER_CACHE_LOCK = threading.Lock()
+
+# Checkout session cache - a paid session stays paid, so repeat verify-payment calls reuse it
+CHECKOUT_SESSION_CACHE_TTL = 300  # 5 minutes
+_CHECKOUT_SESSION_CACHE = TTLCache(maxsize=1000, ttl=CHECKOUT_SESSION_CACHE_TTL)
+_CHECKOUT_SESSION_CACHE_LOCK = threading.Lock()
+
+# Recently applied webhook event ids - Stripe retries are acknowledged without any DB work.
+# processed_webhook_events stays the authority for anything this process has not seen
+APPLIED_EVENT_CACHE_TTL = 86400  # 24 hours
+_APPLIED_EVENTS = TTLCache(maxsize=10000, ttl=APPLIED_EVENT_CACHE_TTL)
+_APPLIED_EVENTS_LOCK = threading.Lock()
+
+def remember_customer(subscription_id, customer_id):
+    """Record a Stripe subscription's customer id so the portal can skip looking it up"""
+    if subscription_id and customer_id:
+        with _CUSTOMER_CACHE_LOCK:
+            _CUSTOMER_CACHE[subscription_id] = customer_id
+
+def mark_event_applied(event_id):
+    """Remember a committed webhook event so redeliveries skip the database"""
+    if event_id:
+        with _APPLIED_EVENTS_LOCK:
+            _APPLIED_EVENTS[event_id] = True
+
+def invalidate_subscription_cache(user_id):
+    """Drop the cached subscription status for a user after any write"""
+    user_id = int(user_id)
+    with _SUB_CACHE_LOCK:
+        _SUB_CACHE.pop(user_id, None)
+        _SUB_CACHE_GENERATIONS[user_id] = _SUB_CACHE_GENERATIONS.get(user_id, 0) + 1
+
+def invalidate_identity_cache(user_id):
+    """Drop the cached email for a user after their account changes"""
+    with _IDENTITY_CACHE_LOCK:
+        _IDENTITY_CACHE.pop(int(user_id), None)
+
+def verify_stripe_signature(payload, sig_header):
+    """Check a Stripe-Signature header (HMAC-SHA256 of 't.payload') against the raw body"""
+    if not sig_header:
+        return False
+    
+    timestamp = None
+    signatures = []
+    for item in sig_header.split(','):
+        key, _, value = item.strip().partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+    
+    if not timestamp or not signatures:
+        return False
+    
+    # Replayed deliveries carry an old signed timestamp - reject them before any other work
+    try:
+        if abs(time.time() - int(timestamp)) > WEBHOOK_TOLERANCE_SECONDS:
+            return False
+    except ValueError:
+        return False
+    
+    expected = hmac.new(_WEBHOOK_KEY, timestamp.encode() + b'.' + payload, hashlib.sha256).hexdigest()
+    return any(hmac.compare_digest(expected, signature) for signature in signatures)
+
+def utc_from_timestamp(timestamp):
+    """Convert a Unix timestamp to a naive UTC datetime, matching the utcnow() columns"""
+    # Plain offset from the epoch - no tzinfo object or local-time conversion involved
+    return _UTC_EPOCH + timedelta(seconds=timestamp)
+
+def get_subscription_period(stripe_subscription, plan_type):
+    """Read the billing period from a Stripe subscription, estimating it when absent"""
+    try:
+        period_start = utc_from_timestamp(stripe_subscription['current_period_start'])
+        period_end = utc_from_timestamp(stripe_subscription['current_period_end'])
+    except (KeyError, TypeError):
+        # Use current time as fallback
+        period_start = datetime.utcnow()
+        period_end = period_start + timedelta(days=PLAN_PERIOD_DAYS.get(plan_type, 365))
+    return period_start, period_end
+
+def upsert_subscription(values, keep_existing_period=False):
+    """Insert or update the user's subscription row in a single statement"""
+    table = Subscription.__table__
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(**values)
+        incoming = stmt.inserted
+    else:
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**values)
+        incoming = stmt.excluded
+    
+    # Ordered - MySQL applies ON DUPLICATE KEY assignments left to right, so the
+    # period columns must be resolved before stripe_subscription_id is overwritten
+    updates = []
+    if keep_existing_period:
+        same_subscription = db.and_(
+            table.c.stripe_subscription_id == incoming.stripe_subscription_id,
+            table.c.current_period_end.isnot(None)
+        )
+        for column in ('current_period_start', 'current_period_end'):
+            updates.append((column, db.case(
+                (same_subscription, table.c[column]),
+                else_=incoming[column]
+            )))
+    
+    for column in values:
+        if column != 'user_id' and not (keep_existing_period and column.startswith('current_period_')):
+            updates.append((column, incoming[column]))
+    updates.append(('updated_at', datetime.utcnow()))
+    
+    if dialect == 'mysql':
+        stmt = stmt.on_duplicate_key_update(updates)
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id'], set_=dict(updates))
+    
+    db.session.execute(stmt)
+
+def retrieve_checkout_session(session_id):
+    """Fetch a checkout session with its subscription expanded, reusing recent paid sessions"""
+    with _CHECKOUT_SESSION_CACHE_LOCK:
+        session = _CHECKOUT_SESSION_CACHE.get(session_id)
+    if session is not None:
+        return session
+    
+    # Expand the subscription so its billing period comes back in the same call
+    session = stripe.checkout.Session.retrieve(session_id, expand=['subscription'])
+    # Unpaid sessions can still complete, so only paid ones are safe to reuse
+    if session.payment_status == 'paid':
+        with _CHECKOUT_SESSION_CACHE_LOCK:
+            _CHECKOUT_SESSION_CACHE[session_id] = session
+    return session
+
+def get_user_id_from_token():
+    """Extract user id from JWT token without touching the database"""
     try:
         auth_header = request.headers.get('Authorization')
         
@@ -30,13 +262,9 @@ def get_user_from_token():
         if not token:
             return None, jsonify({'message': 'Token missing from authorization header'}), 401
         
-        # Import JWT functions
         try:
-            import jwt
-            JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
-            
             # Decode the token manually
-            decoded_token = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+            decoded_token = jwt.decode(token, JWT_SECRET_KEY, algorithms=JWT_ALGORITHMS)
             user_id_str = decoded_token.get('sub')
             
             if not user_id_str:
@@ -48,468 +276,594 @@ def get_user_from_token():
         except jwt.ExpiredSignatureError:
             return None, jsonify({'message': 'Token has expired'}), 401
         except jwt.InvalidTokenError as e:
-            print(f"JWT decode error: {e}")
+            logger.warning("JWT decode error: %s", e)
             return None, jsonify({'message': 'Invalid token'}), 401
         except ValueError:
             return None, jsonify({'message': 'Invalid user ID in token'}), 401
         except Exception as jwt_error:
-            print(f"JWT processing error: {jwt_error}")
+            logger.error("JWT processing error: %s", jwt_error)
             return None, jsonify({'message': 'Token validation failed'}), 401
         
-        user = User.query.get(user_id)
-        
-        if not user:
-            return None, jsonify({'message': 'User not found'}), 404
-            
-        return user, None, None
+        return user_id, None, None
         
     except Exception as e:
-        print(f"Token validation error: {e}")
+        logger.error("Token validation error: %s", e)
         return None, jsonify({'message': 'Authentication failed'}), 401
 
+def get_identity_from_token():
+    """Extract (user_id, email) from JWT token - the users table is only hit on a cache miss"""
+    user_id, error_response, status_code = get_user_id_from_token()
+    if error_response:
+        return None, None, error_response, status_code
+    
+    with _IDENTITY_CACHE_LOCK:
+        email = _IDENTITY_CACHE.get(user_id)
+    
+    if email is None:
+        email = db.session.execute(
+            lambda_stmt(lambda: select(User.email).where(User.id == user_id))
+        ).scalar()
+        
+        if email is None:
+            return None, None, jsonify({'message': 'User not found'}), 404
+        
+        with _IDENTITY_CACHE_LOCK:
+            _IDENTITY_CACHE[user_id] = email
+        
+    return user_id, email, None, None
+
+def get_user_with_subscription(user_id, active_only=True):
+    """Load user and subscription in one joined query - (None, None) if user is missing"""
+    # lambda_stmt caches the built statement by the lambda's code, so repeat calls skip
+    # constructing the select and only bind the new user_id
+    if active_only:
+        stmt = lambda_stmt(lambda: select(User, Subscription).outerjoin(
+            Subscription, db.and_(Subscription.user_id == User.id, Subscription.status == 'active')
+        ).where(User.id == user_id))
+    else:
+        stmt = lambda_stmt(lambda: select(User, Subscription).outerjoin(
+            Subscription, Subscription.user_id == User.id
+        ).where(User.id == user_id))
+    
+    row = db.session.execute(stmt).first()
+    
+    if not row:
+        return None, None
+    return row[0], row[1]
+
+def get_subscription_status_row(user_id):
+    """Load the user's id and active subscription columns as a plain row - no ORM objects built"""
+    return db.session.execute(lambda_stmt(lambda: select(
+        User.id.label('account_id'),
+        Subscription.id, Subscription.user_id, Subscription.plan_type, Subscription.status,
+        Subscription.payment_method, Subscription.amount, Subscription.currency,
+        Subscription.current_period_start, Subscription.current_period_end,
+        Subscription.created_at, Subscription.updated_at
+    ).outerjoin(
+        Subscription, db.and_(Subscription.user_id == User.id, Subscription.status == 'active')
+    ).where(User.id == user_id))).first()
+
+def subscription_row_to_dict(row):
+    """Serialize a get_subscription_status_row() row in the shape of Subscription.to_dict()"""
+    subscription = row._asdict()
+    del subscription['account_id']
+    subscription['amount'] = float(subscription['amount']) if subscription['amount'] else None
+    for column in ('current_period_start', 'current_period_end', 'created_at', 'updated_at'):
+        subscription[column] = subscription[column].isoformat() if subscription[column] else None
+    return subscription
+
+def get_user_and_subscription_from_token(active_only=True):
+    """Extract user and subscription from JWT token with a single DB round-trip"""
+    user_id, error_response, status_code = get_user_id_from_token()
+    if error_response:
+        return None, None, error_response, status_code
+    
+    user, subscription = get_user_with_subscription(user_id, active_only=active_only)
+    
+    if not user:
+        return None, None, jsonify({'message': 'User not found'}), 404
+        
+    return user, subscription, None, None
+
+# Subscription plans - static, so the response body and its ETag are built once at import
+SUBSCRIPTION_PLANS = [
+    {
+        'id': 'monthly',
+        'name': 'Monthly Plan',
+        'price': PLAN_AMOUNTS['monthly'],
+        'currency': 'USD',
+        'interval': 'month',
+        'features': [
+            'Unlimited Bitcoin wills',
+            'Secure document generation',
+            'Beneficiary management',
+            'Legal template library',
+            'Email support'
+        ]
+    },
+    {
+        'id': 'yearly',
+        'name': 'Yearly Plan',
+        'price': PLAN_AMOUNTS['yearly'],
+        'currency': 'USD',
+        'interval': 'year',
+        'features': [
+            'Unlimited Bitcoin wills',
+            'Secure document generation',
+            'Beneficiary management',
+            'Legal template library',
+            'Priority support'
+        ],
+        'savings': '17% savings'
+    }
+]
+_PLANS_JSON = orjson.dumps({'plans': SUBSCRIPTION_PLANS})
+_PLANS_ETAG = hashlib.sha256(_PLANS_JSON).hexdigest()
+# Plans only change with a deploy, and the ETag lets clients revalidate cheaply after that
+PLANS_MAX_AGE = 86400  # 24 hours
+
+# Per-endpoint message for unexpected failures, returned by handle_unexpected_error
+ENDPOINT_ERROR_MESSAGES = {
+    'subscription.create_stripe_checkout_session': 'Checkout failed',
+    'subscription.verify_payment': 'Failed to verify payment',
+    'subscription.get_subscription_status': 'Failed to get subscription status',
+    'subscription.create_customer_portal': 'Failed to create customer portal',
+    'subscription.cancel_subscription': 'Failed to cancel subscription'
+}
+
+@subscription_bp.errorhandler(Exception)
+def handle_unexpected_error(e):
+    """Log, roll back and answer 500 for anything a subscription route did not handle itself"""
+    # Werkzeug HTTP errors (bad JSON, 413, ...) keep their own status
+    if isinstance(e, HTTPException):
+        return e
+    
+    db.session.rollback()
+    logger.exception("Unhandled error in %s", request.endpoint)
+    message = ENDPOINT_ERROR_MESSAGES.get(request.endpoint, 'Internal server error')
+    return jsonify({'message': message}), 500
+
 @subscription_bp.route('/plans', methods=['GET'])
 @cross_origin()
 def get_subscription_plans():
     """Get available subscription plans - PRESERVED WORKING CODE"""
-    try:
-        plans = [
-            {
-                'id': 'monthly',
-                'name': 'Monthly Plan',
-                'price': 29.99,
-                'currency': 'USD',
-                'interval': 'month',
-                'features': [
-                    'Unlimited Bitcoin wills',
-                    'Secure document generation',
-                    'Beneficiary management',
-                    'Legal template library',
-                    'Email support'
-                ]
-            },
-            {
-                'id': 'yearly',
-                'name': 'Yearly Plan',
-                'price': 299.99,
-                'currency': 'USD',
-                'interval': 'year',
-                'features': [
-                    'Unlimited Bitcoin wills',
-                    'Secure document generation',
-                    'Beneficiary management',
-                    'Legal template library',
-                    'Priority support'
-                ],
-                'savings': '17% savings'
-            }
-        ]
-        
-        return jsonify({'plans': plans}), 200
-        
-    except Exception as e:
-        print(f"Get plans error: {e}")
-        return jsonify({'message': 'Failed to get subscription plans'}), 500
+    # Clients that already hold the current plans get an empty 304
+    if _PLANS_ETAG in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(_PLANS_JSON, mimetype='application/json')
+    
+    response.set_etag(_PLANS_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = PLANS_MAX_AGE
+    return response
 
 @subscription_bp.route('/create-checkout-session', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def create_stripe_checkout_session():
     """Create Stripe checkout session - PRESERVED WORKING CODE"""
-    if request.method == 'OPTIONS':
-        return '', 200
-        
-    try:
-        user, error_response, status_code = get_user_from_token()
-        if not user:
-            return error_response, status_code
-        
-        data = request.get_json()
-        if not data:
-            return jsonify({'message': 'No data provided'}), 422
-            
-        plan = data.get('plan')
-        
-        if plan not in ['monthly', 'yearly']:
-            return jsonify({'message': 'Invalid plan. Must be "monthly" or "yearly"'}), 422
-        
-        # Check if Stripe is configured
-        if not stripe.api_key:
-            return jsonify({'message': 'Stripe not configured - missing STRIPE_SECRET_KEY'}), 500
-            
-        if not stripe.api_key.startswith('sk_'):
-            return jsonify({'message': 'Invalid Stripe secret key format'}), 500
-        
-        print(f"Creating checkout session for user {user.id}, plan: {plan}")
+    user_id, user_email, error_response, status_code = get_identity_from_token()
+    if error_response:
+        return error_response, status_code
+    
+    data = request.get_json()
+    if not data:
+        return jsonify({'message': 'No data provided'}), 422
         
-        # Create price dynamically (like working app.py)
-        try:
-            if plan == 'monthly':
-                price_id = STRIPE_MONTHLY_PRICE_ID
-                print(f"Created monthly price: {price_id}")
-            else:  # yearly
-                price_id = STRIPE_YEARLY_PRICE_ID
-                print(f"Created yearly price: {price_id}")
-                
-        except Exception as price_error:
-            print(f"Failed to create price: {price_error}")
-            return jsonify({'message': f'Failed to create pricing: {str(price_error)}'}), 500
+    plan = data.get('plan')
+    
+    if plan not in PLAN_AMOUNTS:
+        return jsonify({'message': 'Invalid plan. Must be "monthly" or "yearly"'}), 422
+    
+    # Check if Stripe is configured
+    if not stripe.api_key:
+        return jsonify({'message': 'Stripe not configured - missing STRIPE_SECRET_KEY'}), 500
         
-        # Get the frontend URL for redirects
-        frontend_url = request.headers.get('Origin', 'https://thebitcoinwill.com')
-        print(f"Frontend URL: {frontend_url}")
+    if not stripe.api_key.startswith('sk_'):
+        return jsonify({'message': 'Invalid Stripe secret key format'}), 500
+    
+    logger.info("Creating checkout session for user %s, plan: %s", user_id, plan)
+    
+    price_id = PRICE_IDS[plan]
+    # Fail fast instead of spending a Stripe round trip on a session that cannot be created
+    if not price_id:
+        return jsonify({'message': f'Stripe not configured - missing STRIPE_{plan.upper()}_PRICE_ID'}), 500
+    logger.debug("Using %s price: %s", plan, price_id)
+    
+    # Get the frontend URL for redirects
+    frontend_url = request.headers.get('Origin', 'https://thebitcoinwill.com')
+    logger.debug("Frontend URL: %s", frontend_url)
+    
+    # Create checkout session
+    try:
+        logger.debug("Creating Stripe checkout session with price_id: %s", price_id)
+        
+        metadata = {
+            'user_id': str(user_id),
+            'user_email': user_email,
+            'plan': plan
+        }
+        
+        # Same user, plan, origin and email within the window -> same key, so double clicks
+        # and client retries get the existing session instead of creating another one
+        window = int(time.time() // CHECKOUT_IDEMPOTENCY_WINDOW)
+        idempotency_key = hashlib.sha256(
+            f"checkout:{user_id}:{plan}:{frontend_url}:{user_email}:{window}".encode()
+        ).hexdigest()
+        
+        session = stripe.checkout.Session.create(
+            **CHECKOUT_TEMPLATES[plan],
+            idempotency_key=idempotency_key,
+            success_url=f"{frontend_url}/?payment=success&session_id={{CHECKOUT_SESSION_ID}}",
+            cancel_url=f"{frontend_url}/?payment=cancelled",
+            metadata=metadata,
+            subscription_data={'metadata': metadata}
+        )
+        
+        logger.info("Successfully created checkout session: %s", session.id)
         
-        # Create checkout session
-        try:
-            print(f"Creating Stripe checkout session with price_id: {price_id}")
-            
-            session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price': price_id,
-                    'quantity': 1
-                }],
-                mode='subscription',
-                success_url=f"{frontend_url}/?payment=success&session_id={{CHECKOUT_SESSION_ID}}",
-                cancel_url=f"{frontend_url}/?payment=cancelled",
-                metadata={
-                    'user_id': str(user.id),
-                    'user_email': user.email,
-                    'plan': plan
-                },
-                subscription_data={
-                    'metadata': {
-                        'user_id': str(user.id),
-                        'user_email': user.email,
-                        'plan': plan
-                    }
-                }
-            )
-            
-            print(f"Successfully created checkout session: {session.id}")
-            
-            return jsonify({
-                'checkout_url': session.url,
-                'session_id': session.id
-            }), 200
-            
-        except Exception as session_error:
-            print(f"Checkout session creation error: {session_error}")
-            return jsonify({'message': f'Failed to create checkout session: {str(session_error)}'}), 500
+        return jsonify({
+            'checkout_url': session.url,
+            'session_id': session.id
+        }), 200
         
-    except Exception as e:
-        print(f"General checkout error: {e}")
-        return jsonify({'message': f'Checkout failed: {str(e)}'}), 500
+    except Exception as session_error:
+        logger.error("Checkout session creation error: %s", session_error)
+        return jsonify({'message': f'Failed to create checkout session: {str(session_error)}'}), 500
 
 @subscription_bp.route('/verify-payment', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def verify_payment():
     """Verify payment and create subscription - PRESERVED WORKING CODE"""
-    if request.method == 'OPTIONS':
-        return '', 200
+    user_id, _, error_response, status_code = get_identity_from_token()
+    if error_response:
+        return error_response, status_code
     
-    try:
-        user, error_response, status_code = get_user_from_token()
-        if not user:
-            return error_response, status_code
-        
-        data = request.get_json()
-        if not data:
-            return jsonify({'message': 'No data provided'}), 422
-            
-        session_id = data.get('session_id')
-        if not session_id:
-            return jsonify({'message': 'Session ID required'}), 422
+    data = request.get_json()
+    if not data:
+        return jsonify({'message': 'No data provided'}), 422
         
-        print(f"Verifying payment for session: {session_id}")
-        
-        # Retrieve the session from Stripe
-        try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            print(f"Retrieved session: {session.payment_status}")
+    session_id = data.get('session_id')
+    if not session_id:
+        return jsonify({'message': 'Session ID required'}), 422
+    
+    logger.info("Verifying payment for session: %s", session_id)
+    
+    # Retrieve the session from Stripe
+    try:
+        session = retrieve_checkout_session(session_id)
+        logger.debug("Retrieved session: %s", session.payment_status)
+        
+        if session.payment_status == 'paid':
+            # Get subscription details
+            stripe_subscription = session.subscription
+            subscription_id = stripe_subscription.id if stripe_subscription else None
+            remember_customer(subscription_id, session.customer)
+            logger.debug("Subscription ID: %s", subscription_id)
             
-            if session.payment_status == 'paid':
-                # Get subscription details
-                subscription_id = session.subscription
-                print(f"Subscription ID: {subscription_id}")
+            if subscription_id:
+                logger.debug("Retrieved subscription: %s", stripe_subscription.status)
                 
-                if subscription_id:
-                    stripe_subscription = stripe.Subscription.retrieve(subscription_id)
-                    print(f"Retrieved subscription: {stripe_subscription.status}")
-                    
-                    # Determine plan type from metadata
-                    plan_type = session.metadata.get('plan', 'monthly')
-                    amount = 29.99 if plan_type == 'monthly' else 299.99
-                    
-                    print(f"Plan type: {plan_type}, Amount: {amount}")
-                    
-                    # Create or update subscription in database
-                    existing_subscription = Subscription.query.filter_by(user_id=user.id).first()
-                    
-                    # FIXED: Safely access current_period_start and current_period_end
-                    try:
-                        period_start = datetime.fromtimestamp(stripe_subscription.current_period_start)
-                        period_end = datetime.fromtimestamp(stripe_subscription.current_period_end)
-                    except (AttributeError, TypeError) as period_error:
-                        print(f"Period access error: {period_error}")
-                        # Use current time as fallback
-                        period_start = datetime.utcnow()
-                        period_end = datetime.utcnow() + timedelta(days=30 if plan_type == 'monthly' else 365)
-                    
-                    if existing_subscription:
-                        # Update existing subscription
-                        existing_subscription.plan_type = plan_type
-                        existing_subscription.status = 'active'
-                        existing_subscription.stripe_subscription_id = subscription_id
-                        existing_subscription.payment_method = 'stripe'
-                        existing_subscription.amount = amount
-                        existing_subscription.current_period_start = period_start
-                        existing_subscription.current_period_end = period_end
-                        existing_subscription.updated_at = datetime.utcnow()
-                        print("Updated existing subscription")
-                    else:
-                        # Create new subscription
-                        new_subscription = Subscription(
-                            user_id=user.id,
-                            plan_type=plan_type,
-                            status='active',
-                            stripe_subscription_id=subscription_id,
-                            payment_method='stripe',
-                            amount=amount,
-                            currency='USD',
-                            current_period_start=period_start,
-                            current_period_end=period_end
-                        )
-                        db.session.add(new_subscription)
-                        print("Created new subscription")
-                    
-                    db.session.commit()
-                    print("Subscription saved to database")
-                    
-                    return jsonify({
-                        'message': 'Payment verified and subscription activated',
-                        'subscription': {
-                            'plan_type': plan_type,
-                            'status': 'active',
-                            'amount': amount
-                        }
-                    }), 200
-                else:
-                    print("No subscription ID found in session")
-                    return jsonify({'message': 'No subscription found in payment session'}), 400
-            else:
-                print(f"Payment not completed: {session.payment_status}")
-                return jsonify({'message': 'Payment not completed'}), 400
+                # Determine plan type from metadata
+                plan_type = session.metadata.get('plan', 'monthly')
+                amount = PLAN_AMOUNTS[plan_type]
                 
-        except Exception as stripe_error:
-            print(f"Stripe verification error: {stripe_error}")
-            return jsonify({'message': 'Failed to verify payment'}), 500
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Payment verification error: {e}")
+                logger.debug("Plan type: %s, Amount: %s", plan_type, amount)
+                
+                period_start, period_end = get_subscription_period(stripe_subscription, plan_type)
+                
+                # Create or update subscription in database
+                upsert_subscription({
+                    'user_id': user_id,
+                    'plan_type': plan_type,
+                    'status': 'active',
+                    'stripe_subscription_id': subscription_id,
+                    'payment_method': 'stripe',
+                    'amount': amount,
+                    'currency': 'USD',
+                    'current_period_start': period_start,
+                    'current_period_end': period_end
+                })
+                
+                db.session.commit()
+                invalidate_subscription_cache(user_id)
+                logger.info("Subscription saved to database for user %s", user_id)
+                
+                return jsonify({
+                    'message': 'Payment verified and subscription activated',
+                    'subscription': {
+                        'plan_type': plan_type,
+                        'status': 'active',
+                        'amount': amount
+                    }
+                }), 200
+            else:
+                logger.warning("No subscription ID found in session %s", session_id)
+                return jsonify({'message': 'No subscription found in payment session'}), 400
+        else:
+            logger.info("Payment not completed: %s", session.payment_status)
+            return jsonify({'message': 'Payment not completed'}), 400
+            
+    except Exception as stripe_error:
+        logger.error("Stripe verification error: %s", stripe_error)
         return jsonify({'message': 'Failed to verify payment'}), 500
 
 @subscription_bp.route('/status', methods=['GET', 'OPTIONS'])
 @cross_origin()
 def get_subscription_status():
     """Get user's subscription status - PRESERVED WORKING CODE"""
-    if request.method == 'OPTIONS':
-        return '', 200
-        
-    try:
-        user, error_response, status_code = get_user_from_token()
-        if not user:
-            return error_response, status_code
-        
-        # Get active subscription
-        subscription = Subscription.query.filter_by(
-            user_id=user.id, 
-            status='active'
-        ).first()
-        
-        if subscription:
-            return jsonify({
-                'active': True,
-                'subscription': subscription.to_dict()
-            }), 200
-        else:
-            return jsonify({
-                'active': False,
-                'subscription': None
-            }), 200
-            
-    except Exception as e:
-        print(f"Subscription status error: {e}")
-        return jsonify({'message': 'Failed to get subscription status'}), 500
+    user_id, error_response, status_code = get_user_id_from_token()
+    if error_response:
+        return error_response, status_code
+    
+    # Serve the serialized body from cache when possible - invalidated on every subscription write
+    with _SUB_CACHE_LOCK:
+        status_body = _SUB_CACHE.get(user_id)
+        generation = _SUB_CACHE_GENERATIONS.get(user_id, 0)
+    if status_body is not None:
+        return current_app.response_class(status_body, mimetype='application/json')
+    
+    # Get user and active subscription columns in one query - read-only, so no ORM objects
+    row = get_subscription_status_row(user_id)
+    if not row:
+        return jsonify({'message': 'User not found'}), 404
+    
+    if row.id is not None:
+        status_payload = {
+            'active': True,
+            'subscription': subscription_row_to_dict(row)
+        }
+    else:
+        status_payload = {
+            'active': False,
+            'subscription': None
+        }
+    
+    status_body = orjson.dumps(status_payload)
+    with _SUB_CACHE_LOCK:
+        if _SUB_CACHE_GENERATIONS.get(user_id, 0) == generation:
+            _SUB_CACHE[user_id] = status_body
+    return current_app.response_class(status_body, mimetype='application/json')
 
 @subscription_bp.route('/manage', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def create_customer_portal():
     """Create Stripe customer portal session - NEW FUNCTIONALITY"""
-    if request.method == 'OPTIONS':
-        return '', 200
-        
+    user, subscription, error_response, status_code = get_user_and_subscription_from_token()
+    if not user:
+        return error_response, status_code
+    
+    if not subscription:
+        return jsonify({'message': 'No active subscription found'}), 404
+    
+    if not subscription.stripe_subscription_id:
+        return jsonify({'message': 'No Stripe subscription found'}), 404
+    
+    logger.info("Creating customer portal for subscription: %s", subscription.stripe_subscription_id)
+    
+    # Get the Stripe subscription to find the customer - only on a cache miss, so the
+    # portal session create is usually the single Stripe round trip on this path
     try:
-        user, error_response, status_code = get_user_from_token()
-        if not user:
-            return error_response, status_code
+        with _CUSTOMER_CACHE_LOCK:
+            customer_id = _CUSTOMER_CACHE.get(subscription.stripe_subscription_id)
         
-        # Get user's active subscription
-        subscription = Subscription.query.filter_by(
-            user_id=user.id, 
-            status='active'
-        ).first()
+        if customer_id is None:
+            stripe_subscription = stripe.Subscription.retrieve(subscription.stripe_subscription_id)
+            customer_id = stripe_subscription.customer
+            remember_customer(subscription.stripe_subscription_id, customer_id)
         
-        if not subscription:
-            return jsonify({'message': 'No active subscription found'}), 404
+        logger.debug("Found customer ID: %s", customer_id)
         
-        if not subscription.stripe_subscription_id:
-            return jsonify({'message': 'No Stripe subscription found'}), 404
+        # Get the frontend URL for return
+        frontend_url = request.headers.get('Origin', 'https://thebitcoinwill.com')
         
-        print(f"Creating customer portal for subscription: {subscription.stripe_subscription_id}")
+        # Create customer portal session
+        portal_session = stripe.billing_portal.Session.create(
+            customer=customer_id,
+            return_url=f"{frontend_url}/?portal=return"
+        )
         
-        # Get the Stripe subscription to find the customer
-        try:
-            stripe_subscription = stripe.Subscription.retrieve(subscription.stripe_subscription_id)
-            customer_id = stripe_subscription.customer
-            
-            print(f"Found customer ID: {customer_id}")
-            
-            # Get the frontend URL for return
-            frontend_url = request.headers.get('Origin', 'https://thebitcoinwill.com')
-            
-            # Create customer portal session
-            portal_session = stripe.billing_portal.Session.create(
-                customer=customer_id,
-                return_url=f"{frontend_url}/?portal=return"
-            )
-            
-            print(f"Created portal session: {portal_session.url}")
-            
-            return jsonify({
-                'portal_url': portal_session.url
-            }), 200
-            
-        except Exception as stripe_error:
-            print(f"Stripe portal error: {stripe_error}")
-            return jsonify({'message': 'Failed to create customer portal'}), 500
+        logger.debug("Created portal session: %s", portal_session.url)
         
-    except Exception as e:
-        print(f"Customer portal error: {e}")
+        return jsonify({
+            'portal_url': portal_session.url
+        }), 200
+        
+    except Exception as stripe_error:
+        logger.error("Stripe portal error: %s", stripe_error)
         return jsonify({'message': 'Failed to create customer portal'}), 500
 
+def process_stripe_event(event):
+    """Apply a verified Stripe webhook event to the subscriptions table"""
+    event_type = event['type']
+    event_id = event.get('id')
+    
+    # Stripe retries deliveries - skip events that were already applied
+    if event_id and db.session.get(ProcessedWebhookEvent, event_id):
+        logger.info("Duplicate webhook event ignored: %s", event_id)
+        mark_event_applied(event_id)
+        return
+    
+    # Handle checkout session completed
+    if event_type in CHECKOUT_WEBHOOK_EVENTS:
+        session = event['data']['object']
+        user_id = session['metadata'].get('user_id')
+        plan = session['metadata'].get('plan')
+        
+        logger.info("Checkout completed for user %s, plan %s", user_id, plan)
+        
+        if user_id:
+            try:
+                subscription_id = session.get('subscription')
+                remember_customer(subscription_id, session.get('customer'))
+                if subscription_id:
+                    amount = PLAN_AMOUNTS[plan]
+                    
+                    # Checkout events only carry the subscription id - the real billing period
+                    # arrives with customer.subscription.* events, so an estimate is written
+                    # only when no period is stored yet for this Stripe subscription
+                    period_start, period_end = get_subscription_period({}, plan)
+                    
+                    # Create or update subscription
+                    upsert_subscription({
+                        'user_id': int(user_id),
+                        'plan_type': plan,
+                        'status': 'active',
+                        'stripe_subscription_id': subscription_id,
+                        'payment_method': 'stripe',
+                        'amount': amount,
+                        'currency': 'USD',
+                        'current_period_start': period_start,
+                        'current_period_end': period_end
+                    }, keep_existing_period=True)
+                    
+                    # Record the event in the same transaction so a failed write is retried
+                    if event_id:
+                        db.session.add(ProcessedWebhookEvent(event_id=event_id, event_type=event_type))
+                    
+                    db.session.commit()
+                    mark_event_applied(event_id)
+                    invalidate_subscription_cache(user_id)
+                    logger.info("Subscription activated for user %s", user_id)
+                    
+            except OperationalError:
+                # Dropped connection, deadlock or lock wait timeout - let Stripe redeliver
+                db.session.rollback()
+                raise
+            except Exception as db_error:
+                logger.error("Database error in webhook: %s", db_error)
+                db.session.rollback()
+    
+    # Subscription events carry the billing period in the payload itself - a deleted
+    # subscription also cancels the local row
+    elif event_type in SUBSCRIPTION_WEBHOOK_EVENTS:
+        stripe_subscription = event['data']['object']
+        subscription_id = stripe_subscription.get('id')
+        remember_customer(subscription_id, stripe_subscription.get('customer'))
+        
+        try:
+            # Only the columns needed to build the UPDATE - no full ORM object. The row lock
+            # holds concurrent events for the same subscription until this one commits
+            existing_subscription = Subscription.query.with_entities(
+                Subscription.id, Subscription.user_id, Subscription.plan_type
+            ).filter_by(stripe_subscription_id=subscription_id).with_for_update().first() if subscription_id else None
+            
+            if existing_subscription:
+                period_start, period_end = get_subscription_period(
+                    stripe_subscription, existing_subscription.plan_type
+                )
+                changes = {
+                    'current_period_start': period_start,
+                    'current_period_end': period_end,
+                    'updated_at': datetime.utcnow()
+                }
+                if event_type == 'customer.subscription.deleted':
+                    changes['status'] = 'cancelled'
+                
+                db.session.execute(
+                    db.update(Subscription).where(Subscription.id == existing_subscription.id).values(**changes)
+                )
+                
+                if event_id:
+                    db.session.add(ProcessedWebhookEvent(event_id=event_id, event_type=event_type))
+                
+                db.session.commit()
+                mark_event_applied(event_id)
+                invalidate_subscription_cache(existing_subscription.user_id)
+                logger.info("Subscription period updated for %s", subscription_id)
+                
+        except OperationalError:
+            db.session.rollback()
+            raise
+        except Exception as db_error:
+            logger.error("Database error in webhook: %s", db_error)
+            db.session.rollback()
+
 # PRESERVED WORKING CODE - Webhook URL path
 @subscription_bp.route('/webhook/stripe', methods=['POST', 'GET', 'OPTIONS'])
 @cross_origin()
 def stripe_webhook():
     """Handle Stripe webhooks - PRESERVED WORKING CODE"""
-    if request.method in ('GET', 'OPTIONS'):
-        return jsonify({'status': 'ok'}), 200
+    if request.method == 'GET':
+        return current_app.response_class(WEBHOOK_STATUS_BODY, mimetype='application/json')
 
     try:
-        payload = request.get_data(as_text=True)
+        # The last hop is the address our proxy saw - earlier X-Forwarded-For entries are client-supplied
+        client = request.access_route[-1] if request.access_route else request.remote_addr
+        with _WEBHOOK_FAILURES_LOCK:
+            failures = _WEBHOOK_FAILURES.get(client, 0)
+        if _WEBHOOK_KEY and failures >= WEBHOOK_FAILURE_LIMIT:
+            return jsonify({'error': 'Too many invalid requests'}), 429
+        
+        # Bodies declaring a larger Content-Length raise RequestEntityTooLarge; chunked bodies
+        # are cut off at the cap instead, so a read that fills it is treated as oversized too
+        request.max_content_length = MAX_WEBHOOK_BYTES
+        payload = request.get_data(cache=False)
+        if len(payload) >= MAX_WEBHOOK_BYTES:
+            raise RequestEntityTooLarge()
         sig_header = request.headers.get('Stripe-Signature')
         
-        print(f"Webhook received: {len(payload)} bytes")
+        logger.debug("Webhook received: %d bytes", len(payload))
+        
+        # Verify the signature when a webhook secret is configured (optional)
+        if _WEBHOOK_KEY and not verify_stripe_signature(payload, sig_header):
+            logger.warning("Webhook signature verification failed")
+            with _WEBHOOK_FAILURES_LOCK:
+                _WEBHOOK_FAILURES[client] = _WEBHOOK_FAILURES.get(client, 0) + 1
+            return jsonify({'error': 'Invalid signature'}), 400
         
-        # Parse JSON directly (webhook secret optional)
-        event = json.loads(payload)
-        print(f"Webhook processed: {event['type']}")
+        # Parse JSON directly - no stripe.Webhook.construct_event wrapping
+        event = orjson.loads(payload)
+        logger.debug("Webhook processed: %s", event['type'])
         
         event_type = event['type']
         
-        # Handle checkout session completed
-        if event_type in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
-            session = event['data']['object']
-            user_id = session['metadata'].get('user_id')
-            plan = session['metadata'].get('plan')
-            
-            print(f"Checkout completed for user {user_id}, plan {plan}")
-            
-            if user_id:
-                try:
-                    subscription_id = session.get('subscription')
-                    if subscription_id:
-                        stripe_subscription = stripe.Subscription.retrieve(subscription_id)
-                        
-                        # Create or update subscription
-                        existing_subscription = Subscription.query.filter_by(user_id=int(user_id)).first()
-                        amount = 29.99 if plan == 'monthly' else 299.99
-                        
-                        # FIXED: Safely access period data
-                        try:
-                            period_start = datetime.fromtimestamp(stripe_subscription.current_period_start)
-                            period_end = datetime.fromtimestamp(stripe_subscription.current_period_end)
-                        except (AttributeError, TypeError):
-                            period_start = datetime.utcnow()
-                            period_end = datetime.utcnow() + timedelta(days=30 if plan == 'monthly' else 365)
-                        
-                        if existing_subscription:
-                            existing_subscription.status = 'active'
-                            existing_subscription.stripe_subscription_id = subscription_id
-                            existing_subscription.plan_type = plan
-                            existing_subscription.amount = amount
-                            existing_subscription.current_period_start = period_start
-                            existing_subscription.current_period_end = period_end
-                            existing_subscription.updated_at = datetime.utcnow()
-                        else:
-                            new_subscription = Subscription(
-                                user_id=int(user_id),
-                                plan_type=plan,
-                                status='active',
-                                stripe_subscription_id=subscription_id,
-                                payment_method='stripe',
-                                amount=amount,
-                                currency='USD',
-                                current_period_start=period_start,
-                                current_period_end=period_end
-                            )
-                            db.session.add(new_subscription)
-                        
-                        db.session.commit()
-                        print(f"Subscription activated for user {user_id}")
-                        
-                except Exception as db_error:
-                    print(f"Database error in webhook: {db_error}")
-                    db.session.rollback()
-        
-        return jsonify({'received': True}), 200
+        # Acknowledge event types we do not handle without touching the database
+        if event_type not in HANDLED_WEBHOOK_EVENTS:
+            return current_app.response_class(WEBHOOK_RECEIVED_BODY, mimetype='application/json')
+        
+        # Redeliveries of events this process already applied need no DB work at all
+        with _APPLIED_EVENTS_LOCK:
+            already_applied = event.get('id') in _APPLIED_EVENTS
+        if already_applied:
+            logger.info("Duplicate webhook event ignored: %s", event['id'])
+            return current_app.response_class(WEBHOOK_RECEIVED_BODY, mimetype='application/json')
+        
+        # Apply the event before acknowledging - Stripe never redelivers an event it got a 200 for
+        try:
+            process_stripe_event(event)
+        except OperationalError as db_error:
+            logger.warning("Webhook event %s not applied, asking Stripe to retry: %s", event.get('id'), db_error)
+            return jsonify({'error': 'Temporarily unavailable'}), 503
+        
+        return current_app.response_class(WEBHOOK_RECEIVED_BODY, mimetype='application/json')
         
+    except RequestEntityTooLarge:
+        logger.warning("Webhook payload over %d bytes rejected", MAX_WEBHOOK_BYTES)
+        return jsonify({'error': 'Payload too large'}), 413
     except Exception as e:
-        print(f"Webhook processing error: {e}")
+        logger.error("Webhook processing error: %s", e)
         return jsonify({'error': 'Webhook processing failed'}), 500
 
 @subscription_bp.route('/cancel', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def cancel_subscription():
     """Cancel user's subscription - PRESERVED WORKING CODE"""
-    if request.method == 'OPTIONS':
-        return '', 200
+    user, subscription, error_response, status_code = get_user_and_subscription_from_token()
+    if not user:
+        return error_response, status_code
     
-    try:
-        user, error_response, status_code = get_user_from_token()
-        if not user:
-            return error_response, status_code
-        
-        subscription = Subscription.query.filter_by(
-            user_id=user.id, 
-            status='active'
-        ).first()
-        
-        if not subscription:
-            return jsonify({'message': 'No active subscription found'}), 404
-        
-        # Update subscription status in database
-        subscription.status = 'cancelled'
-        subscription.updated_at = datetime.utcnow()
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'Subscription cancelled successfully',
-            'subscription': subscription.to_dict()
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Cancel subscription error: {e}")
-        return jsonify({'message': 'Failed to cancel subscription'}), 500
+    if not subscription:
+        return jsonify({'message': 'No active subscription found'}), 404
+    
+    # Update subscription status in database - local only, no Stripe call on this path
+    subscription.status = 'cancelled'
+    subscription.updated_at = datetime.utcnow()
+    db.session.commit()
+    invalidate_subscription_cache(user.id)
+    
+    return jsonify({
+        'message': 'Subscription cancelled successfully',
+        'subscription': subscription.to_dict()
+    }), 200
 
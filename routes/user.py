@@ -1,29 +1,52 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, g, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_cors import cross_origin
+from sqlalchemy.orm import raiseload
 from models.user import User, db
+from routes.subscription import invalidate_identity_cache
+import logging
 
 user_bp = Blueprint('user', __name__)
+logger = logging.getLogger(__name__)
+
+# Page sizes for the user listing
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 500
+
+def get_current_user():
+    """Load the user named by the JWT once per request - later calls reuse it from flask.g"""
+    if 'current_user' not in g:
+        g.current_user = db.session.get(User, get_jwt_identity())
+    return g.current_user
 
 @user_bp.route('/users', methods=['GET'])
 @jwt_required()
 @cross_origin()
 def get_users():
-    """Get all users (admin only)"""
+    """Get users one page at a time, ordered by id (admin only)"""
     try:
-        users = User.query.all()
-        return jsonify([user.to_dict() for user in users]), 200
-    except Exception as e:
-        print(f"Get users error: {e}")
+        # Keyset pagination - ?after=<last id seen>&limit=<page size>
+        after = request.args.get('after', 0, type=int)
+        limit = max(1, min(request.args.get('limit', USERS_PAGE_SIZE, type=int), USERS_MAX_PAGE_SIZE))
+        
+        # to_dict is column-only - raiseload makes any future relationship access in it fail
+        # loudly instead of issuing one subscriptions/wills query per listed user
+        users = User.query.options(raiseload('*')).filter(User.id > after).order_by(User.id).limit(limit).all()
+        
+        # A full page means there may be more - the cursor is in the body so a truncated
+        # listing can't pass for the whole table; null marks the last page
+        return jsonify({
+            'users': [user.to_dict() for user in users],
+            'next_after': users[-1].id if len(users) == limit else None
+        }), 200
+    except Exception:
+        logger.exception("Get users error")
         return jsonify({'message': 'Failed to retrieve users'}), 500
 
 @user_bp.route('/users', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def create_user():
     """Create a new user"""
-    if request.method == 'OPTIONS':
-        return '', 200
-        
     try:
         data = request.get_json()
         if not data:
@@ -36,8 +59,8 @@ def create_user():
             return jsonify({'message': 'Email and password are required'}), 422
             
         # Check if user already exists
-        existing_user = User.query.filter_by(email=email).first()
-        if existing_user:
+        email_taken = db.session.query(User.query.filter_by(email=email).exists()).scalar()
+        if email_taken:
             return jsonify({'message': 'User with this email already exists'}), 422
             
         user = User(email=email)
@@ -48,9 +71,9 @@ def create_user():
         
         return jsonify(user.to_dict()), 201
         
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Create user error: {e}")
+        logger.exception("Create user error")
         return jsonify({'message': 'Failed to create user'}), 500
 
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
@@ -65,14 +88,14 @@ def get_user(user_id):
         if current_user_id != user_id:
             return jsonify({'message': 'Access denied'}), 403
             
-        user = User.query.get(user_id)
+        user = get_current_user()
         if not user:
             return jsonify({'message': 'User not found'}), 404
             
         return jsonify(user.to_dict()), 200
         
-    except Exception as e:
-        print(f"Get user error: {e}")
+    except Exception:
+        logger.exception("Get user error")
         return jsonify({'message': 'Failed to retrieve user'}), 500
 
 @user_bp.route('/users/<int:user_id>', methods=['PUT', 'OPTIONS'])
@@ -80,9 +103,6 @@ def get_user(user_id):
 @cross_origin()
 def update_user(user_id):
     """Update a user"""
-    if request.method == 'OPTIONS':
-        return '', 200
-        
     try:
         current_user_id = get_jwt_identity()
         
@@ -90,7 +110,7 @@ def update_user(user_id):
         if current_user_id != user_id:
             return jsonify({'message': 'Access denied'}), 403
             
-        user = User.query.get(user_id)
+        user = get_current_user()
         if not user:
             return jsonify({'message': 'User not found'}), 404
             
@@ -102,8 +122,8 @@ def update_user(user_id):
         if 'email' in data:
             email = data['email'].strip().lower()
             # Check if email is already taken by another user
-            existing_user = User.query.filter_by(email=email).filter(User.id != user_id).first()
-            if existing_user:
+            email_taken = db.session.query(User.query.filter_by(email=email).filter(User.id != user_id).exists()).scalar()
+            if email_taken:
                 return jsonify({'message': 'Email already taken'}), 422
             user.email = email
             
@@ -114,11 +134,12 @@ def update_user(user_id):
             user.set_password(password)
         
         db.session.commit()
+        invalidate_identity_cache(user.id)
         return jsonify(user.to_dict()), 200
         
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Update user error: {e}")
+        logger.exception("Update user error")
         return jsonify({'message': 'Failed to update user'}), 500
 
 @user_bp.route('/users/<int:user_id>', methods=['DELETE', 'OPTIONS'])
@@ -126,9 +147,6 @@ def update_user(user_id):
 @cross_origin()
 def delete_user(user_id):
     """Delete a user"""
-    if request.method == 'OPTIONS':
-        return '', 200
-        
     try:
         current_user_id = get_jwt_identity()
         
@@ -136,18 +154,19 @@ def delete_user(user_id):
         if current_user_id != user_id:
             return jsonify({'message': 'Access denied'}), 403
             
-        user = User.query.get(user_id)
+        user = get_current_user()
         if not user:
             return jsonify({'message': 'User not found'}), 404
             
         db.session.delete(user)
         db.session.commit()
+        invalidate_identity_cache(user.id)
         
         return jsonify({'message': 'User deleted successfully'}), 200
         
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Delete user error: {e}")
+        logger.exception("Delete user error")
         return jsonify({'message': 'Failed to delete user'}), 500
 
 @user_bp.route('/profile', methods=['GET'])
@@ -156,16 +175,15 @@ def delete_user(user_id):
 def get_user_profile():
     """Get current user's profile"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'message': 'User not found'}), 404
             
         return jsonify({'user': user.to_dict()}), 200
         
-    except Exception as e:
-        print(f"Get profile error: {e}")
+    except Exception:
+        logger.exception("Get profile error")
         return jsonify({'message': 'Failed to get user profile'}), 500
 
 @user_bp.route('/profile', methods=['PUT', 'OPTIONS'])
@@ -173,12 +191,8 @@ def get_user_profile():
 @cross_origin()
 def update_user_profile():
     """Update current user's profile"""
-    if request.method == 'OPTIONS':
-        return '', 200
-    
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'message': 'User not found'}), 404
@@ -191,8 +205,8 @@ def update_user_profile():
         if 'email' in data:
             email = data['email'].strip().lower()
             # Check if email is already taken
-            existing_user = User.query.filter_by(email=email).filter(User.id != user_id).first()
-            if existing_user:
+            email_taken = db.session.query(User.query.filter_by(email=email).filter(User.id != user.id).exists()).scalar()
+            if email_taken:
                 return jsonify({'message': 'Email already taken'}), 422
             user.email = email
             
@@ -203,13 +217,14 @@ def update_user_profile():
             user.set_password(password)
         
         db.session.commit()
+        invalidate_identity_cache(user.id)
         return jsonify({
             'message': 'Profile updated successfully',
             'user': user.to_dict()
         }), 200
         
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Update profile error: {e}")
+        logger.exception("Update profile error")
         return jsonify({'message': 'Failed to update profile'}), 500
 
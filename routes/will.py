@@ -1,10 +1,17 @@
-from flask import Blueprint, request, jsonify, send_file
-from flask_cors import cross_origin
-from models.user import db, User, Will
+from flask import Blueprint, request, jsonify, send_file, current_app
+from models.user import db, User, Will, decode_personal_info
+from sqlalchemy import lambda_stmt, select
 import json
+import jwt
+import logging
 import os
 import io
+import hashlib
+import functools
+import threading
+import time
 from datetime import datetime
+from cachetools import TTLCache
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -12,6 +19,8 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 
+logger = logging.getLogger(__name__)
+
 # ENCRYPTION IMPORTS - ADDED FOR SECURITY
 try:
     from cryptography.fernet import Fernet
@@ -20,11 +29,44 @@ try:
     import base64
     ENCRYPTION_AVAILABLE = True
 except ImportError:
-    print("Cryptography library not available - Bitcoin data will be stored as JSON")
+    logger.warning("Cryptography library not available - Bitcoin data will be stored as JSON")
     ENCRYPTION_AVAILABLE = False
 
 will_bp = Blueprint('will', __name__)
 
+# JWT settings - read once at import instead of on every authenticated request
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
+JWT_ALGORITHMS = ['HS256']
+
+# Validated token cache - digest of the raw token -> (user_id, exp), so repeat requests with
+# the same token skip the HMAC check and claim parsing. Expiry is still enforced per hit
+TOKEN_CACHE_TTL = 300  # 5 minutes
+_TOKEN_CACHE = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL)
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+# Request field -> Will column for the encrypted JSON fields written by create/update
+ENCRYPTED_WILL_FIELDS = {
+    'assets': 'bitcoin_assets',
+    'beneficiaries': 'beneficiaries',
+    'instructions': 'instructions',
+}
+
+# Fields update copies onto the will as sent
+PLAIN_WILL_FIELDS = ('title', 'status')
+
+# Part of the download ETag - bump when the PDF layout changes so browsers refetch
+WILL_PDF_REVISION = '1'
+
+# Stored columns the will JSON responses are built from - their ETags digest these values,
+# since updated_at alone has one-second resolution on MySQL and misses same-second edits
+WILL_BODY_COLUMNS = (
+    'id', 'title', 'personal_info', 'bitcoin_assets', 'beneficiaries',
+    'instructions', 'status', 'created_at', 'updated_at'
+)
+
+# Stored columns the will PDF is rendered from - with the owner's email, they make up the download ETag
+WILL_PDF_COLUMNS = ('personal_info', 'bitcoin_assets', 'beneficiaries', 'instructions')
+
 def safe_decrypt_bitcoin_data(encrypted_data):
     """Safely decrypt Bitcoin data with enhanced error handling"""
     if not encrypted_data:
@@ -33,7 +75,7 @@ def safe_decrypt_bitcoin_data(encrypted_data):
     try:
         return decrypt_bitcoin_data(encrypted_data)
     except Exception as e:
-        print(f"Decryption error: {e}")
+        logger.warning("Decryption error: %s", e)
         # Try to parse as JSON (fallback for non-encrypted data)
         try:
             if isinstance(encrypted_data, str):
@@ -48,9 +90,14 @@ def get_encryption_key():
     if not ENCRYPTION_AVAILABLE:
         return None
     
+    # Use environment variable or fallback
+    password = os.getenv('BITCOIN_ENCRYPTION_KEY', 'default-bitcoin-will-encryption-key-2024').encode()
+    return derive_encryption_key(password)
+
+@functools.lru_cache(maxsize=4)
+def derive_encryption_key(password):
+    """Derive the Fernet key once per secret - every encrypted field would otherwise rerun PBKDF2"""
     try:
-        # Use environment variable or fallback
-        password = os.getenv('BITCOIN_ENCRYPTION_KEY', 'default-bitcoin-will-encryption-key-2024').encode()
         salt = b'bitcoin_will_salt_2024'  # In production, use random salt per user
         
         kdf = PBKDF2HMAC(
@@ -62,7 +109,7 @@ def get_encryption_key():
         key = base64.urlsafe_b64encode(kdf.derive(password))
         return key
     except Exception as e:
-        print(f"Encryption key generation error: {e}")
+        logger.error("Encryption key generation error: %s", e)
         return None
 
 def encrypt_bitcoin_data(data):
@@ -80,7 +127,7 @@ def encrypt_bitcoin_data(data):
         encrypted_data = f.encrypt(json_data.encode())
         return base64.urlsafe_b64encode(encrypted_data).decode()
     except Exception as e:
-        print(f"Encryption error: {e}")
+        logger.error("Encryption error: %s", e)
         return json.dumps(data)
 
 def decrypt_bitcoin_data(encrypted_data):
@@ -102,14 +149,14 @@ def decrypt_bitcoin_data(encrypted_data):
         decrypted_data = f.decrypt(encrypted_bytes)
         return json.loads(decrypted_data.decode())
     except Exception as e:
-        print(f"Decryption error: {e}")
+        logger.warning("Decryption error: %s", e)
         try:
             return json.loads(encrypted_data)
         except:
             return {}
 
-def get_user_from_token():
-    """Extract user from JWT token - PRESERVED WORKING CODE"""
+def get_user_id_from_token():
+    """Extract user id from JWT token without touching the database"""
     try:
         auth_header = request.headers.get('Authorization')
         
@@ -124,14 +171,16 @@ def get_user_from_token():
         if not token:
             return None, jsonify({'message': 'Token missing from authorization header'}), 401
         
-        # Import JWT functions
+        # The digest covers the signature, so only a token that already validated can hit
+        token_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        with _TOKEN_CACHE_LOCK:
+            cached = _TOKEN_CACHE.get(token_key)
+        if cached is not None and cached[1] > time.time():
+            return cached[0], None, None
+        
         try:
-            import jwt
-            import os
-            JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
-            
             # Decode the token manually
-            decoded_token = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+            decoded_token = jwt.decode(token, JWT_SECRET_KEY, algorithms=JWT_ALGORITHMS)
             user_id_str = decoded_token.get('sub')
             
             if not user_id_str:
@@ -139,29 +188,85 @@ def get_user_from_token():
             
             # Convert string back to integer
             user_id = int(user_id_str)
+            
+            expires_at = decoded_token.get('exp')
+            if expires_at:
+                with _TOKEN_CACHE_LOCK:
+                    _TOKEN_CACHE[token_key] = (user_id, expires_at)
                 
         except jwt.ExpiredSignatureError:
             return None, jsonify({'message': 'Token has expired'}), 401
         except jwt.InvalidTokenError as e:
-            print(f"JWT decode error: {e}")
+            logger.warning("JWT decode error: %s", e)
             return None, jsonify({'message': 'Invalid token'}), 401
         except ValueError:
             return None, jsonify({'message': 'Invalid user ID in token'}), 401
         except Exception as jwt_error:
-            print(f"JWT processing error: {jwt_error}")
+            logger.error("JWT processing error: %s", jwt_error)
             return None, jsonify({'message': 'Token validation failed'}), 401
         
-        user = User.query.get(user_id)
-        
-        if not user:
-            return None, jsonify({'message': 'User not found'}), 404
-            
-        return user, None, None
+        return user_id, None, None
         
     except Exception as e:
-        print(f"Token validation error: {e}")
+        logger.error("Token validation error: %s", e)
         return None, jsonify({'message': 'Authentication failed'}), 401
 
+def get_user_from_token():
+    """Extract user from JWT token - PRESERVED WORKING CODE"""
+    user_id, error_response, status_code = get_user_id_from_token()
+    if error_response:
+        return None, error_response, status_code
+    
+    user = db.session.get(User, user_id)
+    
+    if not user:
+        return None, jsonify({'message': 'User not found'}), 404
+        
+    return user, None, None
+
+def get_user_and_will_from_token(will_id):
+    """Extract user and one of their wills from JWT token with a single joined query"""
+    user_id, error_response, status_code = get_user_id_from_token()
+    if error_response:
+        return None, None, error_response, status_code
+    
+    # Outer join so a missing will still tells us whether the user exists - lambda_stmt
+    # reuses the built statement across requests and only binds the ids
+    row = db.session.execute(lambda_stmt(lambda: select(User, Will).outerjoin(
+        Will, db.and_(Will.user_id == User.id, Will.id == will_id)
+    ).where(User.id == user_id))).first()
+    
+    if not row:
+        return None, None, jsonify({'message': 'User not found'}), 404
+    
+    return row[0], row[1], None, None
+
+def get_will_from_token(will_id):
+    """Extract one of the token user's wills - scoped by owner, so no users lookup is needed"""
+    user_id, error_response, status_code = get_user_id_from_token()
+    if error_response:
+        return None, error_response, status_code
+    
+    will = db.session.execute(lambda_stmt(
+        lambda: select(Will).where(Will.id == will_id, Will.user_id == user_id)
+    )).scalar()
+    
+    if not will:
+        return None, jsonify({'message': 'Will not found'}), 404
+    
+    return will, None, None
+
+def will_etag(*parts):
+    """Digest the values a will response is built from into an ETag"""
+    return hashlib.blake2b(':'.join(map(str, parts)).encode(), digest_size=16).hexdigest()
+
+def revalidated(response, etag):
+    """Tag a will response - private, since it holds personal data, and revalidated on every use"""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 def safe_json_parse(data, default=None):
     """Safely parse JSON data that might be a string or already parsed"""
     if data is None:
@@ -171,7 +276,7 @@ def safe_json_parse(data, default=None):
         try:
             return json.loads(data)
         except (json.JSONDecodeError, ValueError):
-            print(f"Failed to parse JSON: {data}")
+            logger.warning("Failed to parse JSON field")
             return default or {}
     
     if isinstance(data, dict):
@@ -179,7 +284,7 @@ def safe_json_parse(data, default=None):
     
     # Handle unexpected data types (like integers)
     if isinstance(data, (int, float, bool)):
-        print(f"Warning: Expected dict/string but got {type(data)}: {data}")
+        logger.warning("Expected dict/string but got %s", type(data).__name__)
         return default or {}
     
     return default or {}
@@ -187,7 +292,7 @@ def safe_json_parse(data, default=None):
 def generate_comprehensive_bitcoin_will_pdf(will_data, user_email):
     """Generate Bitcoin Asset Addendum PDF - A supplementary document for existing wills"""
     try:
-        print(f"Generating Bitcoin Asset Addendum document...")
+        logger.debug("Generating Bitcoin Asset Addendum document")
         
         # Parse all JSON fields safely - DECRYPT BITCOIN DATA
         personal_info = safe_json_parse(will_data.get('personal_info'), {})
@@ -310,7 +415,7 @@ def generate_comprehensive_bitcoin_will_pdf(will_data, user_email):
         
         # Ensure address is a dictionary before calling .get()
         if not isinstance(address, dict):
-            print(f"Warning: Address data is not a dict: {type(address)} = {address}")
+            logger.warning("Address data is not a dict: %s", type(address).__name__)
             address = {}
         
         city = address.get('city', '[CITY]') if isinstance(address, dict) else '[CITY]'
@@ -389,7 +494,7 @@ def generate_comprehensive_bitcoin_will_pdf(will_data, user_email):
                             ['Wallet Address (Public):', wallet_data.get('address', 'N/A')]
                         ]
                     else:
-                        print(f"Warning: Wallet data is not a dict: {type(wallet_data)} = {wallet_data}")
+                        logger.warning("Wallet data is not a dict: %s", type(wallet_data).__name__)
                         wallet_info = [
                             [f'Wallet {i}:', ''],
                             ['Type:', 'N/A'],
@@ -748,25 +853,30 @@ By using this document, you acknowledge that you understand these limitations an
         
         return pdf_data
         
-    except Exception as e:
-        print(f"PDF generation error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise e
+    except Exception:
+        logger.exception("PDF generation error")
+        raise
 
-@will_bp.route('/list', methods=['GET', 'OPTIONS'])
-@cross_origin()
+@will_bp.route('/list', methods=['GET'])
 def list_wills():
     """List all wills for the authenticated user - PRESERVED WORKING CODE"""
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    user, error_response, status_code = get_user_from_token()
+    # Only the id is needed to filter - no users lookup; a deleted user simply has no wills
+    user_id, error_response, status_code = get_user_id_from_token()
     if error_response:
         return error_response, status_code
     
     try:
-        wills = Will.query.filter_by(user_id=user.id).all()
+        # Plain rows of just the listed columns - no ORM instances to hydrate, and nothing
+        # that could lazy-load a relationship once per will
+        wills = db.session.execute(lambda_stmt(lambda: select(
+            Will.id, Will.user_id, Will.title, Will.personal_info, Will.bitcoin_assets,
+            Will.beneficiaries, Will.instructions, Will.status, Will.created_at, Will.updated_at
+        ).where(Will.user_id == user_id))).all()
+        
+        # Unchanged since the client's copy - skip decryption and serialization entirely
+        etag = will_etag('list', user_id, *(getattr(will, column) for will in wills for column in WILL_BODY_COLUMNS))
+        if etag in request.if_none_match:
+            return revalidated(current_app.response_class(status=304), etag)
         
         will_list = []
         for will in wills:
@@ -776,7 +886,7 @@ def list_wills():
                     'id': will.id,
                     'user_id': will.user_id,
                     'title': will.title,
-                    'personal_info': will.get_personal_info() if will.personal_info else {},
+                    'personal_info': decode_personal_info(will.personal_info),
                     'bitcoin_assets': safe_decrypt_bitcoin_data(will.bitcoin_assets),
                     'beneficiaries': safe_decrypt_bitcoin_data(will.beneficiaries),
                     'executor_instructions': safe_decrypt_bitcoin_data(getattr(will, 'executor_instructions', None) or getattr(will, 'instructions', None)),
@@ -785,26 +895,20 @@ def list_wills():
                     'updated_at': will.updated_at.isoformat() if will.updated_at else None
                 }
                 will_list.append(will_dict)
-            except Exception as will_error:
-                print(f"Error processing will {will.id}: {will_error}")
+            except Exception:
+                logger.exception("Error processing will %s", will.id)
                 # Skip this will and continue with others
                 continue
         
-        return jsonify({'wills': will_list}), 200
+        return revalidated(jsonify({'wills': will_list}), etag), 200
         
-    except Exception as e:
-        print(f"Error listing wills: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error listing wills")
         return jsonify({'message': 'Failed to retrieve wills'}), 500
 
-@will_bp.route('/create', methods=['POST', 'OPTIONS'])
-@cross_origin()
+@will_bp.route('/create', methods=['POST'])
 def create_will():
     """Create a new will - PRESERVED WORKING CODE WITH ENCRYPTION"""
-    if request.method == 'OPTIONS':
-        return '', 200
-    
     user, error_response, status_code = get_user_from_token()
     if error_response:
         return error_response, status_code
@@ -815,32 +919,20 @@ def create_will():
         if not data:
             return jsonify({'message': 'No data provided'}), 400
         
-        # Create new will
+        # Create new will - ENCRYPT BITCOIN DATA, all columns passed to the constructor at once
+        encrypted_columns = {
+            column: encrypt_bitcoin_data(data[field])
+            for field, column in ENCRYPTED_WILL_FIELDS.items() if field in data
+        }
         will = Will(
             user_id=user.id,
-            title=data.get('title', f'Bitcoin Will - {datetime.now().strftime("%Y-%m-%d")}'),
-            status='draft'
+            title=data['title'] if 'title' in data else f'Bitcoin Will - {datetime.now().strftime("%Y-%m-%d")}',
+            status='draft',
+            **encrypted_columns
         )
         
-        # Set JSON data - ENCRYPT BITCOIN DATA
         if 'personal_info' in data:
             will.set_personal_info(data['personal_info'])
-        if 'assets' in data:
-            # ENCRYPT BITCOIN ASSETS BEFORE STORAGE
-            encrypted_assets = encrypt_bitcoin_data(data['assets'])
-            will.bitcoin_assets = encrypted_assets
-        if 'beneficiaries' in data:
-            # ENCRYPT BENEFICIARIES BEFORE STORAGE
-            encrypted_beneficiaries = encrypt_bitcoin_data(data['beneficiaries'])
-            will.beneficiaries = encrypted_beneficiaries
-        if 'instructions' in data:
-            # ENCRYPT INSTRUCTIONS BEFORE STORAGE
-            encrypted_instructions = encrypt_bitcoin_data(data['instructions'])
-            # Use correct field name - try executor_instructions first, fallback to instructions
-            if hasattr(will, 'executor_instructions'):
-                will.executor_instructions = encrypted_instructions
-            else:
-                will.instructions = encrypted_instructions
         if 'legal_compliance' in data:
             # ENCRYPT LEGAL COMPLIANCE DATA BEFORE STORAGE
             encrypted_compliance = encrypt_bitcoin_data(data['legal_compliance'])
@@ -870,28 +962,22 @@ def create_will():
             'will': will_dict
         }), 201
         
-    except Exception as e:
-        print(f"Error creating will: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error creating will")
         return jsonify({'message': 'Failed to create will'}), 500
 
-@will_bp.route('/<int:will_id>', methods=['GET', 'OPTIONS'])
-@cross_origin()
+@will_bp.route('/<int:will_id>', methods=['GET'])
 def get_will(will_id):
     """Get a specific will - PRESERVED WORKING CODE WITH DECRYPTION"""
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    user, error_response, status_code = get_user_from_token()
+    will, error_response, status_code = get_will_from_token(will_id)
     if error_response:
         return error_response, status_code
     
     try:
-        will = Will.query.filter_by(id=will_id, user_id=user.id).first()
-        
-        if not will:
-            return jsonify({'message': 'Will not found'}), 404
+        # Unchanged since the client's copy - skip decryption and serialization entirely
+        etag = will_etag(*(getattr(will, column) for column in WILL_BODY_COLUMNS))
+        if etag in request.if_none_match:
+            return revalidated(current_app.response_class(status=304), etag)
         
         # AVOID CALLING will.to_dict() WHICH CAUSES JSON PARSE ERROR
         will_dict = {
@@ -907,64 +993,42 @@ def get_will(will_id):
             'updated_at': will.updated_at.isoformat() if will.updated_at else None
         }
         
-        return jsonify({'will': will_dict}), 200
+        return revalidated(jsonify({'will': will_dict}), etag), 200
         
-    except Exception as e:
-        print(f"Error retrieving will: {e}")
+    except Exception:
+        logger.exception("Error retrieving will")
         return jsonify({'message': 'Failed to retrieve will'}), 500
 
-@will_bp.route('/<int:will_id>', methods=['PUT', 'OPTIONS'])
-@cross_origin()
+@will_bp.route('/<int:will_id>', methods=['PUT'])
 def update_will(will_id):
     """Update a will - PRESERVED WORKING CODE WITH ENCRYPTION"""
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    user, error_response, status_code = get_user_from_token()
+    will, error_response, status_code = get_will_from_token(will_id)
     if error_response:
         return error_response, status_code
     
     try:
-        will = Will.query.filter_by(id=will_id, user_id=user.id).first()
-        
-        if not will:
-            return jsonify({'message': 'Will not found'}), 404
-        
         data = request.get_json()
         
         if not data:
             return jsonify({'message': 'No data provided'}), 400
         
         # Update will data - ENCRYPT BITCOIN DATA
-        if 'title' in data:
-            will.title = data['title']
+        for field in PLAIN_WILL_FIELDS:
+            if field in data:
+                setattr(will, field, data[field])
+        for field, column in ENCRYPTED_WILL_FIELDS.items():
+            if field in data:
+                setattr(will, column, encrypt_bitcoin_data(data[field]))
         if 'personal_info' in data:
             will.set_personal_info(data['personal_info'])
-        if 'assets' in data:
-            # ENCRYPT BITCOIN ASSETS BEFORE STORAGE
-            encrypted_assets = encrypt_bitcoin_data(data['assets'])
-            will.bitcoin_assets = encrypted_assets
-        if 'beneficiaries' in data:
-            # ENCRYPT BENEFICIARIES BEFORE STORAGE
-            encrypted_beneficiaries = encrypt_bitcoin_data(data['beneficiaries'])
-            will.beneficiaries = encrypted_beneficiaries
-        if 'instructions' in data:
-            # ENCRYPT INSTRUCTIONS BEFORE STORAGE
-            encrypted_instructions = encrypt_bitcoin_data(data['instructions'])
-            # Use correct field name - try executor_instructions first, fallback to instructions
-            if hasattr(will, 'executor_instructions'):
-                will.executor_instructions = encrypted_instructions
-            else:
-                will.instructions = encrypted_instructions
         if 'legal_compliance' in data:
             # ENCRYPT LEGAL COMPLIANCE DATA BEFORE STORAGE
             encrypted_compliance = encrypt_bitcoin_data(data['legal_compliance'])
             will.legal_compliance = encrypted_compliance
-        if 'status' in data:
-            will.status = data['status']
         
-        will.updated_at = datetime.utcnow()
-        db.session.commit()
+        # updated_at is stamped by the column's onupdate - a PUT that changes nothing writes nothing
+        if db.session.is_modified(will):
+            db.session.commit()
         
         # Return will dict with decrypted data for frontend
         # AVOID CALLING will.to_dict() WHICH CAUSES JSON PARSE ERROR
@@ -987,28 +1051,28 @@ def update_will(will_id):
             'will': will_dict
         }), 200
         
-    except Exception as e:
-        print(f"Error updating will: {e}")
+    except Exception:
+        logger.exception("Error updating will")
         return jsonify({'message': 'Failed to update will'}), 500
 
-@will_bp.route('/<int:will_id>/download', methods=['GET', 'OPTIONS'])
-@cross_origin()
+@will_bp.route('/<int:will_id>/download', methods=['GET'])
 def download_will(will_id):
     """Download will as PDF - PRESERVED WORKING CODE WITH DECRYPTION"""
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    user, error_response, status_code = get_user_from_token()
+    user, will, error_response, status_code = get_user_and_will_from_token(will_id)
     if error_response:
         return error_response, status_code
     
     try:
-        will = Will.query.filter_by(id=will_id, user_id=user.id).first()
-        
         if not will:
             return jsonify({'message': 'Will not found'}), 404
         
-        print(f"Generating comprehensive Bitcoin will PDF with ALL details for will {will_id}")
+        # The PDF is a pure function of these columns and the owner's email - a browser that
+        # already holds this revision gets a 304 before any PDF work happens
+        etag = will_etag(WILL_PDF_REVISION, user.email, *(getattr(will, column) for column in WILL_PDF_COLUMNS))
+        if etag in request.if_none_match:
+            return revalidated(current_app.response_class(status=304), etag)
+        
+        logger.info("Generating will PDF for will %s", will_id)
         
         # Get will data - DECRYPT FOR PDF GENERATION
         will_data = {
@@ -1019,8 +1083,6 @@ def download_will(will_id):
             'legal_compliance': getattr(will, 'legal_compliance', None)  # Will be decrypted in PDF function
         }
         
-        print(f"Will data structure: {will_data}")
-        
         # Generate comprehensive Bitcoin will PDF with ALL original details + legal framework
         pdf_data = generate_comprehensive_bitcoin_will_pdf(will_data, user.email)
         
@@ -1032,43 +1094,40 @@ def download_will(will_id):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"bitcoin_will_{will_id}_{timestamp}.pdf"
         
-        return send_file(
+        response = send_file(
             pdf_buffer,
             as_attachment=True,
             download_name=filename,
             mimetype='application/pdf'
         )
+        return revalidated(response, etag)
         
-    except Exception as e:
-        print(f"Error generating will PDF: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error generating will PDF")
         return jsonify({'message': 'Failed to generate PDF'}), 500
 
-@will_bp.route('/<int:will_id>', methods=['DELETE', 'OPTIONS'])
-@cross_origin()
+@will_bp.route('/<int:will_id>', methods=['DELETE'])
 def delete_will(will_id):
     """Delete a will - PRESERVED WORKING CODE"""
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    user, error_response, status_code = get_user_from_token()
+    user_id, error_response, status_code = get_user_id_from_token()
     if error_response:
         return error_response, status_code
     
     try:
-        will = Will.query.filter_by(id=will_id, user_id=user.id).first()
-        
-        if not will:
+        # One DELETE scoped to the owner - nothing is loaded, and no match means not found
+        deleted = db.session.execute(
+            db.delete(Will).where(Will.id == will_id, Will.user_id == user_id)
+        ).rowcount
+        if not deleted:
+            db.session.rollback()
             return jsonify({'message': 'Will not found'}), 404
         
-        db.session.delete(will)
         db.session.commit()
         
         return jsonify({'message': 'Will deleted successfully'}), 200
         
-    except Exception as e:
-        print(f"Error deleting will: {e}")
+    except Exception:
+        logger.exception("Error deleting will")
         return jsonify({'message': 'Failed to delete will'}), 500
 
 